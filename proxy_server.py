@@ -7,13 +7,22 @@ import asyncio
 import sys
 import time
 import subprocess
+import hashlib
+import hmac
+import random
+import shutil
+import threading
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field, fields
+from urllib.parse import urlsplit
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.env')
 
 # Load config.env (same file used by PowerShell scripts)
-def load_config():
+def load_config(path=CONFIG_PATH):
     config = {}
-    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.env')
-    if os.path.exists(config_path):
-        with open(config_path, 'r') as f:
+    if os.path.exists(path):
+        with open(path, 'r') as f:
             for line in f:
                 line = line.strip()
                 if line and not line.startswith('#') and '=' in line:
@@ -21,8 +30,141 @@ def load_config():
                     config[key.strip()] = value.strip()
     return config
 
+@dataclass(frozen=True)
+class PhaseTimeouts:
+    """Upstream limits for one request class, in seconds. 0 disables a limit."""
+    ttft: float   # request sent -> first response byte (covers OVMS queueing + prefill)
+    idle: float   # longest gap between two upstream chunks
+    total: float  # whole request, however healthy the stream is
+
+@dataclass(frozen=True)
+class Settings:
+    """Immutable snapshot of the tunables read from config.env.
+
+    Each request grabs the current snapshot once and keeps it until it
+    finishes, so a reload never changes the rules under an open stream.
+    """
+    target_url: str
+    model_name: str
+    timeout_total: float
+    timeout_connect: float
+    timeouts_fim: PhaseTimeouts
+    timeouts_chat: PhaseTimeouts
+    config_poll_sec: float
+    fim_cache_enabled: bool
+    fim_cache_ttl_sec: float
+    fim_cache_max_entries: int
+    trace_enabled: bool
+    trace_file: str
+    capture_enabled: bool
+    capture_file: str
+    capture_redact: bool
+    sse_coalesce_ms: float
+    sse_coalesce_backlog: bool
+    hold_sec: float
+    hold_max: int
+    hold_release_rate: float
+    batch_dir: str
+    batch_concurrency: int
+    batch_yield: bool
+    batch_max_mb: float
+    batch_hold_sec: float
+    embed_batch_ms: float
+    embed_batch_max: int
+    pool_size: int
+    pool_keepalive_sec: float
+    pool_warmup: int
+    retry_attempts: int
+    admin_token: str = field(repr=False, metadata={'secret': True})
+
+    def timeouts_for(self, kind, streaming=True):
+        """Phase limits for a request class.
+
+        A non-streamed response arrives only once generation has finished, so
+        TTFT and idle would cap the whole generation; such requests get `total` only.
+        """
+        if kind == 'fim':
+            limits = self.timeouts_fim
+        elif kind == 'chat':
+            limits = self.timeouts_chat
+        else:
+            limits = PhaseTimeouts(ttft=0.0, idle=0.0, total=self.timeout_total)
+        return limits if streaming else PhaseTimeouts(ttft=0.0, idle=0.0, total=limits.total)
+
+def _cfg_number(cfg, key, default, cast=float, minimum=0):
+    raw = cfg.get(key, '')
+    if raw == '':
+        return default
+    try:
+        value = cast(raw)
+    except ValueError:
+        raise ValueError(f"{key}={raw!r} is not a valid number")
+    if value < minimum:
+        raise ValueError(f"{key}={raw!r} must be >= {minimum}")
+    return value
+
+def _cfg_flag(cfg, key, default):
+    raw = cfg.get(key, '').lower()
+    if raw == '':
+        return default
+    if raw in ('1', 'true', 'yes', 'on'):
+        return True
+    if raw in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"{key}={raw!r} is not a valid on/off flag")
+
+def _cfg_path(cfg, key, default):
+    path = cfg.get(key, '') or default
+    return os.path.join(os.path.dirname(CONFIG_PATH), path)
+
+def _cfg_timeouts(cfg, kind, ttft, idle, total):
+    return PhaseTimeouts(
+        ttft=_cfg_number(cfg, f'PROXY_TIMEOUT_{kind}_TTFT', ttft),
+        idle=_cfg_number(cfg, f'PROXY_TIMEOUT_{kind}_IDLE', idle),
+        total=_cfg_number(cfg, f'PROXY_TIMEOUT_{kind}_TOTAL', total),
+    )
+
+def build_settings(cfg):
+    """Validate a parsed config.env dict. Raises ValueError on bad values."""
+    host = cfg.get('OVMS_HOST', 'localhost') or 'localhost'
+    port = _cfg_number(cfg, 'OVMS_PORT', 8000, int, 1)
+    return Settings(
+        target_url=f"http://{host}:{port}",
+        model_name=cfg.get('MODEL_NAME', ''),
+        timeout_total=_cfg_number(cfg, 'PROXY_TIMEOUT_TOTAL', 300.0),
+        timeout_connect=_cfg_number(cfg, 'PROXY_TIMEOUT_CONNECT', 10.0),
+        timeouts_fim=_cfg_timeouts(cfg, 'FIM', 10.0, 10.0, 30.0),
+        timeouts_chat=_cfg_timeouts(cfg, 'CHAT', 120.0, 60.0, 1800.0),
+        config_poll_sec=_cfg_number(cfg, 'PROXY_CONFIG_POLL_SEC', 2.0, float, 0.1),
+        fim_cache_enabled=_cfg_flag(cfg, 'PROXY_FIM_CACHE', True),
+        fim_cache_ttl_sec=_cfg_number(cfg, 'PROXY_FIM_CACHE_TTL', 30.0),
+        fim_cache_max_entries=_cfg_number(cfg, 'PROXY_FIM_CACHE_MAX_ENTRIES', 256, int),
+        trace_enabled=_cfg_flag(cfg, 'PROXY_TRACE', False),
+        trace_file=_cfg_path(cfg, 'PROXY_TRACE_FILE', os.path.join('artficats', 'proxy_trace.json')),
+        capture_enabled=_cfg_flag(cfg, 'PROXY_CAPTURE', False),
+        capture_file=_cfg_path(cfg, 'PROXY_CAPTURE_FILE', os.path.join('artficats', 'proxy_capture.jsonl')),
+        capture_redact=_cfg_flag(cfg, 'PROXY_CAPTURE_REDACT', True),
+        sse_coalesce_ms=_cfg_number(cfg, 'PROXY_SSE_COALESCE_MS', 0.0),
+        sse_coalesce_backlog=_cfg_flag(cfg, 'PROXY_SSE_COALESCE_BACKLOG', True),
+        hold_sec=_cfg_number(cfg, 'PROXY_HOLD_SEC', 60.0),
+        hold_max=_cfg_number(cfg, 'PROXY_HOLD_MAX', 64, int),
+        hold_release_rate=_cfg_number(cfg, 'PROXY_HOLD_RELEASE_RATE', 4.0, float, 0.1),
+        batch_dir=_cfg_path(cfg, 'PROXY_BATCH_DIR', os.path.join('artficats', 'batches')),
+        batch_concurrency=_cfg_number(cfg, 'PROXY_BATCH_CONCURRENCY', 2, int, 1),
+        batch_yield=_cfg_flag(cfg, 'PROXY_BATCH_YIELD', True),
+        batch_max_mb=_cfg_number(cfg, 'PROXY_BATCH_MAX_MB', 256.0),
+        batch_hold_sec=_cfg_number(cfg, 'PROXY_BATCH_HOLD_SEC', 600.0),
+        embed_batch_ms=_cfg_number(cfg, 'PROXY_EMBED_BATCH_MS', 3.0),
+        embed_batch_max=_cfg_number(cfg, 'PROXY_EMBED_BATCH_MAX_INPUTS', 32, int, 1),
+        pool_size=_cfg_number(cfg, 'PROXY_POOL_SIZE', 16, int, 1),
+        pool_keepalive_sec=_cfg_number(cfg, 'PROXY_POOL_KEEPALIVE_SEC', 60.0),
+        pool_warmup=_cfg_number(cfg, 'PROXY_POOL_WARMUP', 2, int),
+        retry_attempts=_cfg_number(cfg, 'PROXY_RETRY_ATTEMPTS', 2, int),
+        admin_token=cfg.get('PROXY_ADMIN_TOKEN', ''),
+    )
+
 _cfg = load_config()
-TARGET_URL = f"http://localhost:{_cfg.get('OVMS_PORT', '8000')}"
+_settings = build_settings(_cfg)
 PORT = int(_cfg.get('PROXY_PORT', '8001'))
 
 # ── Telemetry ──────────────────────────────────────────────
@@ -119,19 +261,1085 @@ async def telemetry_loop():
             pass
         await asyncio.sleep(2)
 
+# ── Config Hot Reload ──────────────────────────────────────
+def _config_stamp():
+    try:
+        st = os.stat(CONFIG_PATH)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+def reload_settings():
+    """Re-read config.env and swap in a new Settings snapshot.
+
+    The swap is a single global assignment, so requests already running
+    keep the snapshot they started with. Invalid files are rejected as a
+    whole and the previous settings stay active.
+    """
+    global _cfg, _settings
+    cfg = load_config()
+    try:
+        new = build_settings(cfg)
+    except ValueError as e:
+        log(f"{C_YELLOW}⚠  Config reload rejected:{C_RESET} {e}")
+        return False
+    old = _settings
+    changed = [f.name for f in fields(Settings) if getattr(old, f.name) != getattr(new, f.name)]
+    if cfg.get('PROXY_PORT', '8001') != _cfg.get('PROXY_PORT', '8001'):
+        log(f"{C_YELLOW}⚠  PROXY_PORT changed{C_RESET} - restart the proxy to listen on the new port")
+    if (old.pool_size, old.pool_keepalive_sec) != (new.pool_size, new.pool_keepalive_sec):
+        log(f"{C_YELLOW}⚠  Connection pool settings changed{C_RESET} - restart the proxy to resize the pool")
+    _cfg, _settings = cfg, new
+    secret = {f.name for f in fields(Settings) if f.metadata.get('secret')}
+    for name in changed:
+        if name in secret:
+            log(f"{C_CYAN}↻  Config:{C_RESET} {name} changed")
+        else:
+            log(f"{C_CYAN}↻  Config:{C_RESET} {name} {getattr(old, name)} → {getattr(new, name)}")
+    return bool(changed)
+
+async def config_watch_loop():
+    """Background task: polls config.env and reloads it when it changes."""
+    last = _config_stamp()
+    while True:
+        await asyncio.sleep(_settings.config_poll_sec)
+        stamp = _config_stamp()
+        if stamp == last:
+            continue
+        last = stamp
+        try:
+            reload_settings()
+        except Exception as e:
+            log(f"{C_RED}✗  Config reload failed:{C_RESET} {e}")
+
 # ── Shared HTTP Session ────────────────────────────────────
 _session = None
 
+_LOOPBACK_HOSTS = {'localhost', '127.0.0.1', '::1'}
+_RETRY_RATIO = 0.2   # each upstream request earns a fifth of a retry...
+_RETRY_BURST = 10.0  # ...up to this many banked, so an outage cannot turn into a retry storm
+
 async def get_session():
     global _session
     if _session is None or _session.closed:
-        timeout = aiohttp.ClientTimeout(total=300, connect=10)
-        _session = aiohttp.ClientSession(timeout=timeout)
+        # Timeouts are applied per request from the active Settings snapshot;
+        # the pool shape is fixed for the lifetime of the session.
+        settings = _settings
+        loopback = urlsplit(settings.target_url).hostname in _LOOPBACK_HOSTS
+        # PROXY_POOL_KEEPALIVE_SEC=0 means no keep-alive: close every connection after use.
+        keepalive = ({'keepalive_timeout': settings.pool_keepalive_sec} if settings.pool_keepalive_sec > 0
+                     else {'force_close': True})
+        connector = aiohttp.TCPConnector(
+            limit=settings.pool_size,
+            limit_per_host=settings.pool_size,
+            use_dns_cache=True,
+            ttl_dns_cache=None if loopback else 300,
+            **keepalive,
+        )
+        _session = aiohttp.ClientSession(connector=connector, trace_configs=[_upstream_trace_config()])
     return _session
 
+class UpstreamPool:
+    """Counters for the upstream connection pool, plus the shared retry budget."""
+
+    def __init__(self):
+        self.hits = 0        # request got an idle keep-alive connection
+        self.misses = 0      # request had to open a new connection
+        self.queued = 0      # request waited for a free slot (pool full)
+        self.warmed = 0
+        self.retries = 0
+        self.retries_denied = 0
+        self.tokens = _RETRY_BURST
+
+    def deposit(self):
+        self.tokens = min(self.tokens + _RETRY_RATIO, _RETRY_BURST)
+
+    async def retry(self, settings, attempt, tag, error):
+        """Spend one retry from the budget; returns False if the request must fail instead."""
+        if attempt >= settings.retry_attempts or self.tokens < 1:
+            self.retries_denied += 1
+            return False
+        self.tokens -= 1
+        self.retries += 1
+        log(f"{C_YELLOW}↻{C_RESET}  {tag}  Upstream {type(error).__name__} before response - retrying ({attempt + 1}/{settings.retry_attempts})")
+        await asyncio.sleep(0.05 * 2 ** attempt)
+        return True
+
+    async def warm(self, settings):
+        """Open `pool_warmup` keep-alive connections so the first requests skip connection setup."""
+        session = await get_session()
+
+        async def probe():
+            async with session.get(f"{settings.target_url}/v3/models", timeout=_request_timeout(settings)) as resp:
+                await resp.read()
+
+        results = await asyncio.gather(*[probe() for _ in range(settings.pool_warmup)], return_exceptions=True)
+        self.warmed = sum(1 for r in results if not isinstance(r, BaseException))
+        if self.warmed:
+            log(f"{C_GREEN}✓{C_RESET}  Upstream pool warmed: {self.warmed} connection(s)")
+        else:
+            log(f"{C_YELLOW}⚠  Upstream not reachable yet{C_RESET} - connections will be opened on demand")
+
+    def stats(self):
+        settings = _settings
+        opened = self.hits + self.misses
+        return {
+            "size": settings.pool_size,
+            "keepalive_sec": settings.pool_keepalive_sec,
+            "warmed": self.warmed,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reuse_ratio": round(self.hits / opened, 3) if opened else 0.0,
+            "queued": self.queued,
+            "retries": self.retries,
+            "retries_denied": self.retries_denied,
+            "retry_budget": round(self.tokens, 1),
+        }
+
+_upstream_pool = UpstreamPool()
+
+def _request_timeout(settings):
+    # Only connect is left to aiohttp; the other phases are enforced by StreamDeadline.
+    return aiohttp.ClientTimeout(total=None, connect=settings.timeout_connect or None)
+
+# ── Phase Timeouts ─────────────────────────────────────────
+_timeout_counts = Counter()  # (request kind, phase) -> count
+
+def _request_kind(target_path):
+    if "chat/completions" in target_path:
+        return 'chat'
+    if "completions" in target_path:
+        return 'fim'
+    return 'other'
+
+class StreamDeadline:
+    """Watchdog for the TTFT, idle-gap and total limits of one upstream call.
+
+    A single timer is kept and only re-armed when it fires, so marking
+    activity per chunk costs one assignment. On expiry the phase is recorded
+    and the handler task is cancelled, which aborts the upstream request.
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.current_task()
+        self.start = self.loop.time()
+        self.last = None  # time of the latest upstream chunk
+        self.expired = None
+        self.handle = None
+        self._arm()
+
+    def activity(self):
+        first = self.last is None
+        self.last = self.loop.time()
+        if first:
+            # The idle deadline may be due before the TTFT/total timer that is armed.
+            self.cancel()
+            self._arm()
+
+    def _next_due(self):
+        due = []
+        if self.limits.total:
+            due.append(self.start + self.limits.total)
+        if self.last is None and self.limits.ttft:
+            due.append(self.start + self.limits.ttft)
+        if self.last is not None and self.limits.idle:
+            due.append(self.last + self.limits.idle)
+        return min(due) if due else None
+
+    def _arm(self):
+        due = self._next_due()
+        if due is not None:
+            self.handle = self.loop.call_at(due, self._check)
+
+    def _check(self):
+        self.handle = None
+        now = self.loop.time()
+        if self.limits.total and now - self.start >= self.limits.total:
+            self.expired = 'total'
+        elif self.last is None and self.limits.ttft and now - self.start >= self.limits.ttft:
+            self.expired = 'ttft'
+        elif self.last is not None and self.limits.idle and now - self.last >= self.limits.idle:
+            self.expired = 'idle'
+        if self.expired:
+            self.task.cancel()
+        else:
+            self._arm()
+
+    def set_limits(self, limits):
+        self.cancel()
+        self.limits = limits
+        self._arm()
+
+    def restart(self):
+        """Start the clock again, e.g. after the request sat in the waiting room."""
+        self.cancel()
+        self.start = self.loop.time()
+        self.last = None
+        self._arm()
+
+    def limit(self):
+        return getattr(self.limits, self.expired) if self.expired else 0
+
+    def cancel(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+def _timeout_stats():
+    stats = {}
+    for (kind, phase), count in sorted(_timeout_counts.items()):
+        stats.setdefault(kind, {})[phase] = count
+    return stats
+
+def _timeout_error(kind, phase, limit):
+    return {"error": {
+        "message": f"Upstream {phase} timeout after {limit:g}s ({kind} request)",
+        "type": "timeout",
+        "code": f"{phase}_timeout",
+    }}
+
+# ── Waiting Room (hold-and-retry) ──────────────────────────
+# While OVMS restarts or swaps models, requests that cannot reach it are parked
+# here instead of failing with 502, then released at a steady rate once the
+# model shows up in /v3/models again.
+_HOLD_BACKOFF_BASE = 0.25
+_HOLD_BACKOFF_MAX = 5.0
+_PROBE_TIMEOUT = 2.0
+_PROBE_FRESH_SEC = 0.2
+_HOLD_MAX_PARKS = 5  # re-parks per request when OVMS lists the model but keeps refusing it
+
+class UpstreamNotReady(Exception):
+    pass
+
+class WaitingRoom:
+    def __init__(self):
+        self.parked = 0
+        self.total_parked = 0
+        self.released = 0
+        self.expired = 0
+        self.rejected = 0
+        self.park_time_total = 0.0
+        self.park_time_max = 0.0
+        self._next_release = 0.0
+        self._probe = None      # in-flight probe future
+        self._probe_at = 0.0
+        self._probe_models = None
+
+    def has_room(self, settings):
+        return settings.hold_sec > 0 and self.parked < settings.hold_max
+
+    async def _models(self, session, settings):
+        """Model ids OVMS currently serves, or None if it is unreachable.
+
+        All parked requests share one probe so a restart is not hammered.
+        """
+        loop = asyncio.get_running_loop()
+        if self._probe is not None:
+            return await asyncio.shield(self._probe)
+        if loop.time() - self._probe_at < _PROBE_FRESH_SEC:
+            return self._probe_models
+        self._probe = asyncio.ensure_future(self._fetch_models(session, settings))
+        try:
+            self._probe_models = await asyncio.shield(self._probe)
+            self._probe_at = loop.time()
+            return self._probe_models
+        finally:
+            self._probe = None
+
+    @staticmethod
+    async def _fetch_models(session, settings):
+        try:
+            timeout = aiohttp.ClientTimeout(total=_PROBE_TIMEOUT)
+            async with session.get(f"{settings.target_url}/v3/models", timeout=timeout) as resp:
+                if resp.status != 200:
+                    return None
+                data = await resp.json(content_type=None)
+                return {str(m.get("id")) for m in data.get("data", []) if isinstance(m, dict)}
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, AttributeError):
+            return None
+
+    async def hold(self, session, settings, model, until, attempt=0):
+        """Park until upstream serves `model`, then wait for a release slot.
+
+        `until` is the loop time at which the request's PROXY_HOLD_SEC runs
+        out; returns False if it passes first. A re-parked request passes its
+        park count as `attempt` so the backoff keeps growing.
+        """
+        loop = asyncio.get_running_loop()
+        self.parked += 1
+        try:
+            while True:
+                remaining = until - loop.time()
+                if remaining <= 0:
+                    return False
+                backoff = min(_HOLD_BACKOFF_MAX, _HOLD_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                await asyncio.sleep(min(backoff, remaining))
+                models = await self._models(session, settings)
+                if models is not None and (not model or model in models):
+                    break
+            # Pace releases so a freshly loaded model is not hit by every parked request at once.
+            now = loop.time()
+            slot = max(now, self._next_release)
+            self._next_release = slot + 1 / settings.hold_release_rate
+            await asyncio.sleep(slot - now)
+            return True
+        finally:
+            self.parked -= 1
+
+    def record_release(self, waited):
+        self.released += 1
+        self.park_time_total += waited
+        self.park_time_max = max(self.park_time_max, waited)
+
+    def stats(self):
+        return {
+            "parked": self.parked,
+            "total_parked": self.total_parked,
+            "released": self.released,
+            "expired": self.expired,
+            "rejected": self.rejected,
+            "park_sec_avg": round(self.park_time_total / self.released, 2) if self.released else 0.0,
+            "park_sec_max": round(self.park_time_max, 2),
+        }
+
+_waiting_room = WaitingRoom()
+
+def _upstream_not_ready(response, model, settings):
+    """503 from OVMS, or 404 for the configured model (it is being (re)loaded)."""
+    if response.status == 503:
+        return True
+    return response.status == 404 and bool(model) and model == settings.model_name
+
+async def _open_upstream(session, request, url, headers, body, settings, trace, capture, deadline, model, tag):
+    """Send the request upstream, holding it in the waiting room while OVMS is down.
+
+    Failures before any response byte (a stale keep-alive connection reset by
+    OVMS, or a refused GET) are retried within the shared retry budget.
+    """
+    _upstream_pool.deposit()
+    loop = asyncio.get_running_loop()
+    attempt = 0
+    parks = 0
+    parked_at = hold_until = None  # one PROXY_HOLD_SEC budget for the whole request
+
+    def hold_exhausted():
+        return (not _waiting_room.has_room(settings) or loop.time() >= hold_until
+                or parks >= _HOLD_MAX_PARKS)
+
+    def give_up():
+        _waiting_room.expired += 1
+        log(f"{C_RED}✗{C_RESET}  {tag}  Upstream still unavailable after {loop.time() - parked_at:.1f}s, giving up")
+
+    while True:
+        capture.upstream_sent()
+        try:
+            response = await session.request(request.method, url, headers=headers, data=body,
+                                             timeout=_request_timeout(settings),
+                                             trace_request_ctx=trace)
+        except aiohttp.ClientConnectorError as e:
+            if not parks and not _waiting_room.has_room(settings):
+                if request.method == 'GET' and await _upstream_pool.retry(settings, attempt, tag, e):
+                    attempt += 1
+                    continue
+                if settings.hold_sec > 0:
+                    _waiting_room.rejected += 1
+                raise
+            if parks and hold_exhausted():
+                give_up()
+                raise UpstreamNotReady(f"Upstream not ready after waiting {loop.time() - parked_at:.0f}s")
+            reason = "cannot connect"
+        except (aiohttp.ServerDisconnectedError, aiohttp.ClientOSError) as e:
+            if not await _upstream_pool.retry(settings, attempt, tag, e):
+                raise
+            attempt += 1
+            trace.instant('retry', error=type(e).__name__)
+            continue
+        else:
+            if not _upstream_not_ready(response, model, settings):
+                if parks:
+                    _waiting_room.record_release(loop.time() - parked_at)
+                return response
+            if not parks and not _waiting_room.has_room(settings):
+                return response
+            if parks and hold_exhausted():
+                give_up()
+                return response  # pass OVMS's own 503/404 through
+            response.release()
+            reason = f"model not ready ({response.status})"
+
+        if not parks:
+            parked_at = loop.time()
+            hold_until = parked_at + settings.hold_sec
+            _waiting_room.total_parked += 1
+        parks += 1
+        log(f"{C_YELLOW}⏸{C_RESET}  {tag}  Upstream {reason} - holding request ({_waiting_room.parked + 1} parked)")
+        deadline.cancel()
+        trace.begin('parked')
+        released = await _waiting_room.hold(session, settings, model, hold_until, parks - 1)
+        trace.end('parked', released=released)
+        if not released:
+            give_up()
+            raise UpstreamNotReady(f"Upstream not ready after waiting {settings.hold_sec:g}s")
+        transport = request.transport
+        if transport is None or transport.is_closing():
+            raise ConnectionResetError("Client disconnected while parked")
+        log(f"{C_GREEN}▶{C_RESET}  {tag}  Released after {loop.time() - parked_at:.1f}s")
+        deadline.restart()
+
 async def cleanup_session(app):
     if _session and not _session.closed:
         await _session.close()
+    _trace_log.close()
+    _capture_log.close()
+
+# ── Request Tracing ────────────────────────────────────────
+# Phase spans are written as Chrome trace events (JSON array format), which
+# chrome://tracing and ui.perfetto.dev open directly. The trailing "]" is
+# optional in that format, so the file can simply be appended to.
+_trace_seq = 0
+
+class AppendLog:
+    """Append-only output file that follows path changes from a config reload."""
+
+    def __init__(self, header=''):
+        self.header = header
+        self.fh = None
+        self.path = None
+
+    def write(self, path, text):
+        if self.path != path:
+            self.close()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.fh = open(path, 'a', encoding='utf-8')
+            self.path = path
+            if self.fh.tell() == 0:
+                self.fh.write(self.header)
+        self.fh.write(text)
+        self.fh.flush()
+
+    def close(self):
+        if self.fh:
+            self.fh.close()
+        self.fh = None
+        self.path = None
+
+_trace_log = AppendLog(header="[\n")
+
+def _now_us():
+    return time.perf_counter_ns() // 1000
+
+class NullTrace:
+    """Stand-in used when tracing is off; every hook is a no-op."""
+    def begin(self, name): pass
+    def end(self, name, **args): pass
+    def instant(self, name, **args): pass
+    def finish(self, trace_file, **args): pass
+
+class RequestTrace(NullTrace):
+    """Collects phase spans for one proxied request."""
+
+    def __init__(self, name):
+        global _trace_seq
+        _trace_seq += 1
+        self.tid = _trace_seq
+        self.name = name
+        self.start = _now_us()
+        self.open = {}
+        self.events = []
+
+    def _event(self, name, ph, ts, **extra):
+        event = {"name": name, "cat": "proxy", "ph": ph, "ts": ts, "pid": os.getpid(), "tid": self.tid}
+        event.update(extra)
+        self.events.append(event)
+
+    def begin(self, name):
+        self.open[name] = _now_us()
+
+    def end(self, name, **args):
+        start = self.open.pop(name, None)
+        if start is not None:
+            self._event(name, "X", start, dur=_now_us() - start, args=args)
+
+    def instant(self, name, **args):
+        self._event(name, "i", _now_us(), s="t", args=args)
+
+    def finish(self, trace_file, **args):
+        for name in list(self.open):
+            self.end(name, unfinished=True)
+        self._event("request", "X", self.start, dur=_now_us() - self.start, args=args)
+        self._event("thread_name", "M", self.start, args={"name": f"#{self.tid} {self.name}"})
+        try:
+            _trace_log.write(trace_file, ''.join(json.dumps(e) + ",\n" for e in self.events))
+        except OSError as e:
+            log(f"{C_YELLOW}⚠  Trace export failed:{C_RESET} {e}")
+
+_NO_TRACE = NullTrace()
+
+def _upstream_trace_config():
+    """aiohttp hooks that split the upstream call into pool wait / connect."""
+    def hook(action, name):
+        async def on_event(session, ctx, params):
+            trace = ctx.trace_request_ctx
+            if isinstance(trace, NullTrace):
+                getattr(trace, action)(name)
+        return on_event
+
+    def count(name):
+        async def on_event(session, ctx, params):
+            setattr(_upstream_pool, name, getattr(_upstream_pool, name) + 1)
+        return on_event
+
+    tc = aiohttp.TraceConfig()
+    tc.on_connection_queued_start.append(count('queued'))
+    tc.on_connection_create_start.append(count('misses'))
+    tc.on_connection_reuseconn.append(count('hits'))
+    tc.on_connection_queued_start.append(hook('begin', 'pool_wait'))
+    tc.on_connection_queued_end.append(hook('end', 'pool_wait'))
+    tc.on_connection_create_start.append(hook('begin', 'connect'))
+    tc.on_connection_create_end.append(hook('end', 'connect'))
+    tc.on_connection_reuseconn.append(hook('instant', 'connection_reused'))
+    tc.on_request_headers_sent.append(hook('instant', 'request_sent'))
+    return tc
+
+# ── Traffic Capture ────────────────────────────────────────
+# One JSON line per request: what the client sent and when, plus the timing
+# of each upstream SSE event. tools/traffic_replay reads this format.
+_CAPTURE_MAX_BODY = 64 * 1024  # non-streamed responses above this keep status/timing only
+_REDACT_KEYS = {'prompt', 'suffix', 'content', 'text', 'input', 'arguments'}
+
+_capture_log = AppendLog()
+
+def _redact(value, key=None):
+    """Replace user text with same-length filler so token counts stay realistic."""
+    if isinstance(value, dict):
+        return {k: _redact(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact(v, key) for v in value]
+    if isinstance(value, str) and key in _REDACT_KEYS:
+        return 'x' * len(value)
+    return value
+
+def _event_text(data):
+    """Text and finish_reason of the first choice in a chat or completion chunk."""
+    choices = data.get('choices') or [{}]
+    ch = choices[0] if isinstance(choices[0], dict) else {}
+    text = ch.get('text')
+    if text is None:
+        text = (ch.get('delta') or {}).get('content') or ''
+    return text, ch.get('finish_reason')
+
+class NullCapture:
+    """Stand-in used when capture is off; every hook is a no-op."""
+    def request_body(self, body): pass
+    def upstream_sent(self): pass
+    def response(self, status, is_sse): pass
+    def event(self, data): pass
+    def body(self, chunk): pass
+    def cached(self, text, finish_reason): pass
+    def finish(self, capture_file, redact, status): pass
+
+class RequestCapture(NullCapture):
+    """Records one request and the timing of its upstream response.
+
+    Response timings (ttfb_ms, event offsets, upstream_ms) count from when the
+    request that got the answer was sent to OVMS, so body read, pool wait,
+    retries and waiting-room time are not replayed as model latency.
+    """
+
+    def __init__(self, request):
+        self.start = time.perf_counter()
+        self.sent = None
+        self.chunks = None
+        self.size = 0
+        self.record = {
+            "t": round(time.time(), 3),
+            "method": request.method,
+            "path": request.path_qs,
+            "client": _detect_client(request.headers),
+            "ua": request.headers.get('User-Agent', ''),
+        }
+
+    def _ms(self):
+        return round((time.perf_counter() - self.start) * 1000, 1)
+
+    def _upstream_ms(self):
+        return round((time.perf_counter() - (self.sent or self.start)) * 1000, 1)
+
+    def upstream_sent(self):
+        self.sent = time.perf_counter()
+
+    def request_body(self, body):
+        if not body:
+            return
+        try:
+            self.record["body"] = json.loads(body)
+        except ValueError:
+            self.record["body_text"] = body.decode('utf-8', errors='replace')
+
+    def response(self, status, is_sse):
+        self.record.update(status=status, sse=is_sse, ttfb_ms=self._upstream_ms())
+        if is_sse:
+            self.record["events"] = []
+        else:
+            self.chunks = []
+
+    def event(self, data):
+        text, finish = _event_text(data)
+        offset = self._upstream_ms()
+        self.record["events"].append([offset, text, finish] if finish else [offset, text])
+
+    def body(self, chunk):
+        if self.chunks is None:
+            return
+        self.size += len(chunk)
+        if self.size > _CAPTURE_MAX_BODY:
+            self.chunks = None
+        else:
+            self.chunks.append(chunk)
+
+    def cached(self, text, finish_reason):
+        self.record.update(status=200, sse=False, ttfb_ms=self._ms(), cache_hit=True,
+                           events=[[self._ms(), text, finish_reason or "stop"]])
+
+    def finish(self, capture_file, redact, status):
+        record = self.record
+        if status is not None:
+            record["status"] = status
+        record["duration_ms"] = self._ms()
+        if self.sent is not None:
+            record["queued_ms"] = round((self.sent - self.start) * 1000, 1)
+            record["upstream_ms"] = self._upstream_ms()
+        if self.chunks:
+            try:
+                record["response"] = json.loads(b''.join(self.chunks))
+            except ValueError:
+                pass
+        if redact:
+            record = _redact(record)
+            record.pop("body_text", None)
+            if "events" in record:
+                record["events"] = [[e[0], 'x' * len(e[1])] + e[2:] for e in record["events"]]
+        try:
+            _capture_log.write(capture_file, json.dumps(record, separators=(',', ':')) + "\n")
+        except OSError as e:
+            log(f"{C_YELLOW}⚠  Capture write failed:{C_RESET} {e}")
+
+_NO_CAPTURE = NullCapture()
+
+# ── SSE Write Coalescing ───────────────────────────────────
+_SSE_MAX_PENDING = 64 * 1024  # flush a batch once it grows this large
+_SSE_BACKLOG_DELAY = 0.02     # batching interval for a backlogged client when PROXY_SSE_COALESCE_MS=0
+_SSE_MAX_HOLD = 4             # a backlogged batch is held for at most this many intervals
+
+class SseWriteStats:
+    """Counts upstream chunks handed to SseWriter vs. actual client writes."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.writes = 0
+        self.bytes = 0
+        self.backlog_waits = 0  # flushes postponed because the client was not draining
+        self._recent = deque(maxlen=10)  # [second, writes, chunks]
+
+    def record(self, chunks, size):
+        self.chunks += chunks
+        self.writes += 1
+        self.bytes += size
+        sec = int(time.monotonic())
+        if self._recent and self._recent[-1][0] == sec:
+            self._recent[-1][1] += 1
+            self._recent[-1][2] += chunks
+        else:
+            self._recent.append([sec, 1, chunks])
+
+    def stats(self):
+        window = self._recent.maxlen
+        recent = [b for b in self._recent if b[0] > int(time.monotonic()) - window]
+        return {
+            "chunks": self.chunks,
+            "writes": self.writes,
+            "bytes": self.bytes,
+            "coalescing_ratio": round(self.chunks / self.writes, 2) if self.writes else 1.0,
+            "backlog_waits": self.backlog_waits,
+            "writes_per_sec": round(sum(b[1] for b in recent) / window, 2),
+            "chunks_per_sec": round(sum(b[2] for b in recent) / window, 2),
+        }
+
+_sse_stats = SseWriteStats()
+
+class SseWriter:
+    """Writes one SSE stream to the client, batching bursts and slow readers.
+
+    A chunk is written straight away only when the client transport has
+    drained and, with max_delay set, the last write is at least max_delay old.
+    Anything else waits in a batch that a timer flushes one interval later
+    (max_delay, or _SSE_BACKLOG_DELAY when max_delay is 0). While the transport
+    is still not draining the timer is re-armed, so a slow client receives
+    fewer, larger writes, up to _SSE_MAX_HOLD intervals or _SSE_MAX_PENDING
+    bytes. The first chunk and urgent ones (end of stream) always go out
+    immediately. With backlog=False the transport is never checked, so
+    max_delay 0 writes every chunk as it arrives.
+    """
+
+    def __init__(self, request, response, trace, max_delay, backlog=True):
+        self.request = request
+        self.response = response
+        self.trace = trace
+        self.max_delay = max_delay
+        self.backlog = backlog
+        self.interval = max_delay if max_delay > 0 else _SSE_BACKLOG_DELAY
+        self.loop = asyncio.get_running_loop()
+        self.lock = asyncio.Lock()
+        self.pending = []
+        self.pending_size = 0
+        self.pending_since = None
+        self.last_flush = None
+        self.timer = None
+        self.task = None
+        self.error = None
+
+    def _backlogged(self):
+        if not self.backlog:
+            return False
+        transport = self.request.transport
+        return transport is not None and transport.get_write_buffer_size() > 0
+
+    async def write(self, data, urgent=False):
+        if self.error:
+            raise self.error
+        if not self.pending:
+            self.pending_since = self.loop.time()
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if urgent or self.last_flush is None or self.pending_size >= _SSE_MAX_PENDING:
+            await self.flush()
+            return
+        now = self.loop.time()
+        due = self.last_flush + self.max_delay
+        if now >= due and not self._backlogged():
+            await self.flush()
+        elif self.timer is None:
+            self.timer = self.loop.call_later(max(due - now, 0.0) or self.interval, self._on_timer)
+
+    def _on_timer(self):
+        self.timer = None
+        held = self.loop.time() - self.pending_since if self.pending else 0.0
+        if self._backlogged() and held < self.interval * _SSE_MAX_HOLD:
+            _sse_stats.backlog_waits += 1
+            self.timer = self.loop.call_later(self.interval, self._on_timer)
+            return
+        self.task = asyncio.ensure_future(self._flush_from_timer())
+
+    async def _flush_from_timer(self):
+        try:
+            await self.flush()
+        except Exception as e:  # surfaced on the next write()/close()
+            self.error = e
+
+    async def flush(self):
+        async with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.pending:
+                return
+            data = b''.join(self.pending)
+            chunks = len(self.pending)
+            self.pending = []
+            self.pending_size = 0
+            self.last_flush = self.loop.time()
+            self.trace.begin('write')
+            await self.response.write(data)
+            self.trace.end('write', bytes=len(data), chunks=chunks)
+            _sse_stats.record(chunks, len(data))
+
+    async def close(self):
+        if self.task is not None:
+            await self.task
+        if self.error:
+            raise self.error
+        await self.flush()
+
+# ── FIM Continuation Cache ─────────────────────────────────
+# Request fields that do not change what the model generates next.
+_FIM_KEY_IGNORE = ('prompt', 'suffix', 'stream', 'stream_options', 'user')
+_FIM_MAX_BODY = 1 << 20  # non-streamed responses larger than this are not cached
+
+# FIM prompt templates that carry the suffix inside `prompt`: the token that
+# opens the prefix, and the tokens that may follow it. Whatever the user types
+# lands just before the first of those.
+_FIM_TEMPLATES = (
+    ('<|fim_prefix|>', ('<|fim_suffix|>', '<|fim_middle|>')),  # Qwen2.5-Coder
+    ('<fim_prefix>', ('<fim_suffix>', '<fim_middle>')),        # StarCoder
+    ('<｜fim▁begin｜>', ('<｜fim▁hole｜>', '<｜fim▁end｜>')),   # DeepSeek-Coder
+)
+
+def _sha(text):
+    return hashlib.sha1(text.encode('utf-8', errors='replace')).hexdigest()
+
+def _split_fim_prompt(prompt):
+    """Split a templated FIM prompt into (prefix, suffix); plain prompts have no suffix."""
+    for open_tok, next_toks in _FIM_TEMPLATES:
+        start = prompt.find(open_tok)
+        if start < 0:
+            continue
+        start += len(open_tok)
+        cuts = [i for i in (prompt.find(tok, start) for tok in next_toks) if i >= 0]
+        if cuts:
+            return prompt[:min(cuts)], prompt[min(cuts):]
+    return prompt, ''
+
+class FimCache:
+    """Per-client cache of recent /completions results for inline autocomplete.
+
+    Entries store a hash of the prompt and the completion text. A new prompt
+    hits when it starts with a cached prompt and the extra characters are a
+    prefix of that completion: the user typed what the model suggested, so the
+    rest of the suggestion is served locally instead of asking OVMS again.
+    For templated FIM prompts only the part before the suffix tokens is
+    matched this way; the suffix is part of the bucket.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()  # (bucket, prompt_len, prompt_hash) -> [completion, finish_reason, stamp]
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.served_chars = 0
+
+    @staticmethod
+    def bucket(client_key, req_json):
+        """Cache partition for a request, or None if it must not be cached."""
+        if not isinstance(req_json, dict) or not isinstance(req_json.get('prompt'), str):
+            return None
+        if req_json.get('n', 1) != 1 or req_json.get('best_of', 1) != 1:
+            return None
+        if req_json.get('echo') or req_json.get('logprobs'):
+            return None
+        params = {k: v for k, v in req_json.items() if k not in _FIM_KEY_IGNORE}
+        return (
+            client_key,
+            str(req_json.get('model', '')),
+            _sha(str(req_json.get('suffix') or '') + _split_fim_prompt(req_json['prompt'])[1]),
+            _sha(json.dumps(params, sort_keys=True, default=str)),
+        )
+
+    def _expire(self, now, settings):
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if now - entry[2] < settings.fim_cache_ttl_sec:
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+    def lookup(self, bucket, prompt, settings):
+        """Return (remaining_text, finish_reason) on a hit, else None."""
+        now = time.monotonic()
+        self._expire(now, settings)
+        best = None
+        prefix_hashes = {}
+        for key, entry in self._entries.items():
+            if key[0] != bucket or key[1] > len(prompt):
+                continue
+            plen = key[1]
+            if plen not in prefix_hashes:
+                prefix_hashes[plen] = _sha(prompt[:plen])
+            if prefix_hashes[plen] != key[2]:
+                continue
+            typed = prompt[plen:]
+            completion = entry[0]
+            if len(completion) > len(typed) and completion.startswith(typed):
+                if best is None or plen > best[0][1]:
+                    best = (key, entry)
+        if best is None:
+            self.misses += 1
+            return None
+        key, entry = best
+        entry[2] = now
+        self._entries.move_to_end(key)
+        rest = entry[0][len(prompt) - key[1]:]
+        self.hits += 1
+        self.served_chars += len(rest)
+        return rest, entry[1]
+
+    def store(self, bucket, prompt, completion, finish_reason, settings):
+        if not completion or settings.fim_cache_max_entries <= 0:
+            return
+        key = (bucket, len(prompt), _sha(prompt))
+        self._entries[key] = [completion, finish_reason, time.monotonic()]
+        self._entries.move_to_end(key)
+        self.stores += 1
+        while len(self._entries) > settings.fim_cache_max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "served_chars": self.served_chars,
+        }
+
+_fim_cache = FimCache()
+
+async def _serve_fim_hit(request, req_json, text, finish_reason):
+    """Answer a /completions request from the cache in OpenAI format."""
+    payload = {
+        "id": f"cmpl-{uuid.uuid4()}",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": req_json.get("model"),
+        "choices": [{"index": 0, "text": text, "logprobs": None, "finish_reason": finish_reason or "stop"}],
+    }
+    if not req_json.get("stream"):
+        return web.json_response(payload, headers={"X-Proxy-Cache": "hit"})
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "X-Proxy-Cache": "hit"})
+    await response.prepare(request)
+    await response.write(f"data: {json.dumps(payload)}\n\ndata: [DONE]\n\n".encode('utf-8'))
+    return response
+
+# ── Embedding Micro-Batching ───────────────────────────────
+# Single-input /embeddings calls that arrive within PROXY_EMBED_BATCH_MS of each
+# other (same model and parameters) are merged into one upstream request with
+# an `input` array, and the result rows are split back to each caller in order.
+_EMBED_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+# Headers that do not change what OVMS returns. All other forwarded headers
+# (Authorization, X-Replay-Id, ...) are part of the group key, so callers are
+# only merged when the upstream call can carry exactly their headers.
+_EMBED_NEUTRAL_HEADERS = {'user-agent', 'accept', 'accept-encoding', 'accept-language',
+                          'connection', 'keep-alive', 'content-type'}
+
+def _embed_inputs(req_json):
+    """The request's inputs as a list of strings, or None if it cannot be merged."""
+    if not isinstance(req_json, dict):
+        return None
+    value = req_json.get('input')
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list) and value and all(isinstance(v, str) for v in value):
+        return value
+    return None
+
+def _size_bucket(n):
+    for limit in _EMBED_SIZE_BUCKETS:
+        if n <= limit:
+            return f"<={limit}"
+    return f">{_EMBED_SIZE_BUCKETS[-1]}"
+
+class EmbeddingBatcher:
+    def __init__(self):
+        self.pending = {}  # group key -> {"callers": [(inputs, future)], "size": n, "timer": handle}
+        self.batches = 0
+        self.requests = 0
+        self.inputs = 0
+        self.fallbacks = 0
+        self.batch_sizes = Counter()   # callers per upstream request
+        self.occupancy = Counter()     # inputs / PROXY_EMBED_BATCH_MAX_INPUTS, in 10% steps
+
+    async def submit(self, settings, path, req_json, headers):
+        """Queue a request; returns (status, body bytes), or None to send it unbatched."""
+        inputs = _embed_inputs(req_json)
+        if inputs is None or len(inputs) >= settings.embed_batch_max:
+            return None
+        params = {k: v for k, v in req_json.items() if k != 'input'}
+        shared = tuple(sorted((k.lower(), v) for k, v in headers.items() if k.lower() not in _EMBED_NEUTRAL_HEADERS))
+        key = (path, json.dumps(params, sort_keys=True, default=str), shared)
+        batch = self.pending.get(key)
+        if batch is not None and batch["size"] + len(inputs) > settings.embed_batch_max:
+            self._flush(key, settings)
+            batch = None
+        if batch is None:
+            loop = asyncio.get_running_loop()
+            batch = {"callers": [], "size": 0, "params": params, "headers": dict(shared)}
+            batch["timer"] = loop.call_later(settings.embed_batch_ms / 1000, self._flush, key, settings)
+            self.pending[key] = batch
+        future = asyncio.get_running_loop().create_future()
+        batch["callers"].append((inputs, future))
+        batch["size"] += len(inputs)
+        if batch["size"] >= settings.embed_batch_max:
+            self._flush(key, settings)
+        return await future
+
+    def _flush(self, key, settings):
+        batch = self.pending.pop(key, None)
+        if batch is None:
+            return
+        batch["timer"].cancel()
+        asyncio.ensure_future(self._send(key[0], batch, settings))
+
+    async def _send(self, path, batch, settings):
+        callers = batch["callers"]
+        merged = [text for inputs, _ in callers for text in inputs]
+        self.batches += 1
+        self.requests += len(callers)
+        self.inputs += len(merged)
+        self.batch_sizes[_size_bucket(len(callers))] += 1
+        step = min(len(merged) * 10 // settings.embed_batch_max, 9) * 10
+        self.occupancy[f"{step}-{step + 10}%"] += 1
+        try:
+            session = await get_session()
+            timeout = aiohttp.ClientTimeout(total=settings.timeout_total or None, connect=settings.timeout_connect or None)
+            async with session.post(f"{settings.target_url}{path}", json={**batch["params"], "input": merged},
+                                    headers=batch["headers"], timeout=timeout) as resp:
+                status, raw = resp.status, await resp.read()
+            if status != 200:
+                # Resend unbatched: the normal path holds 503s in the waiting room,
+                # and one bad input must not fail its neighbours.
+                results = None
+            elif len(callers) == 1:
+                results = [(status, raw)]
+            else:
+                results = _split_embeddings(json.loads(raw), [inputs for inputs, _ in callers])
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError, TypeError):
+            results = None  # fall back to the normal path (waiting room, timeouts, error reporting)
+        if results is None:
+            self.fallbacks += len(callers)
+        for i, (_, future) in enumerate(callers):
+            if not future.done():
+                future.set_result(results[i] if results is not None else None)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "inputs": self.inputs,
+            "avg_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "fallbacks": self.fallbacks,
+            "batch_size_histogram": dict(self.batch_sizes),
+            "occupancy_histogram": dict(sorted(self.occupancy.items(), key=lambda kv: int(kv[0].split('-')[0]))),
+        }
+
+def _split_embeddings(payload, groups):
+    """Cut a merged embeddings response back into one response per caller."""
+    rows = sorted(payload["data"], key=lambda d: d["index"])
+    if len(rows) != sum(len(g) for g in groups):
+        raise ValueError("embedding count does not match inputs")
+    usage = payload.get("usage") or {}
+    total_chars = sum(len(t) for g in groups for t in g) or 1
+    results = []
+    offset = 0
+    for inputs in groups:
+        part = [dict(row, index=row["index"] - offset) for row in rows[offset:offset + len(inputs)]]
+        offset += len(inputs)
+        # OVMS reports usage for the whole batch; split it by share of input text.
+        share = sum(len(t) for t in inputs) / total_chars
+        body = {k: v for k, v in payload.items() if k not in ('data', 'usage')}
+        body["data"] = part
+        if usage:
+            body["usage"] = {k: round(v * share) if isinstance(v, (int, float)) else v for k, v in usage.items()}
+        results.append((200, json.dumps(body).encode('utf-8')))
+    return results
+
+_embed_batcher = EmbeddingBatcher()
 
 # ── Proxy Handler ──────────────────────────────────────────
 _last_model_check = 0
@@ -207,12 +1415,34 @@ def _progress_line(tokens, elapsed):
     return f"  {C_DIM}       {bar}  {tokens} tokens  ({elapsed:.1f}s, {tps:.1f} tok/s){C_RESET}"
 
 async def handle_proxy(request):
+    global _interactive_inflight
+    settings = _settings  # pinned for the lifetime of this request
+    trace = RequestTrace(f"{request.method} {request.path}") if settings.trace_enabled else _NO_TRACE
+    capture = RequestCapture(request) if settings.capture_enabled else _NO_CAPTURE
+    inference = _is_inference(request.path)
+    if inference:
+        _interactive_inflight += 1
+    status = None
+    try:
+        response = await _proxy_request(request, settings, trace, capture)
+        status = response.status
+        return response
+    finally:
+        if inference:
+            _interactive_inflight -= 1
+        trace.finish(settings.trace_file, method=request.method, path=request.path, status=status)
+        capture.finish(settings.capture_file, settings.capture_redact, status)
+
+async def _proxy_request(request, settings, trace, capture):
     global _request_count, _last_model_check, _generating, _completion_id, _total_tokens
     target_path = request.path
     if request.query_string:
         target_path += "?" + request.query_string
-    url = f"{TARGET_URL}{target_path}"
+    url = f"{settings.target_url}{target_path}"
+    trace.begin('body_read')
     body = await request.read()
+    trace.end('body_read', bytes=len(body))
+    capture.request_body(body)
     headers = {k: v for k, v in request.headers.items() if k.lower() not in ['host', 'content-length']}
 
     is_completion = "completions" in target_path
@@ -221,6 +1451,7 @@ async def handle_proxy(request):
         reset_tokens()
 
     # Extract context for logging
+    req_json = None
     req_model = None
     prompt_preview = None
     client = _detect_client(request.headers)
@@ -231,9 +1462,17 @@ async def handle_proxy(request):
         except: pass
         prompt_preview = _extract_prompt_preview(body)
 
+    # Inline autocomplete: plain /completions with a prompt go through the FIM cache
+    fim_bucket = None
+    if settings.fim_cache_enabled and is_completion and not is_chat and request.method == 'POST':
+        client_key = f"{request.remote}|{request.headers.get('User-Agent', '')}"
+        fim_bucket = FimCache.bucket(client_key, req_json)
+        fim_prompt = _split_fim_prompt(req_json["prompt"])[0] if fim_bucket is not None else None
+
     _request_count += 1
     req_start = time.time()
     this_id = None
+    tag = ""
 
     # Log arrival for completions
     if is_completion:
@@ -248,24 +1487,74 @@ async def handle_proxy(request):
         log(f"   Model: {model_str}")
         if prompt_preview:
             log(f"   {C_DIM}\"{prompt_preview}\"{C_RESET}")
+
+    if fim_bucket is not None:
+        hit = _fim_cache.lookup(fim_bucket, fim_prompt, settings)
+        if hit is not None:
+            log(f"{C_GREEN}⚡{C_RESET}  {tag}  FIM cache hit  │  {len(hit[0])} chars served locally")
+            trace.instant('fim_cache_hit', chars=len(hit[0]))
+            capture.cached(*hit)
+            return await _serve_fim_hit(request, req_json, *hit)
+
+    if settings.embed_batch_ms > 0 and request.method == 'POST' and target_path.endswith('/embeddings'):
+        try:
+            embed_json = json.loads(body)
+        except ValueError:
+            embed_json = None
+        batched = await _embed_batcher.submit(settings, target_path, embed_json, headers)
+        if batched is not None:
+            status, payload = batched
+            capture.response(status, False)
+            capture.body(payload)
+            if status >= 400:
+                _log_non_completion(target_path, status, time.time() - req_start)
+            return web.Response(body=payload, status=status, content_type='application/json')
+
+    if is_completion:
         _generating = True
 
     session = await get_session()
+    kind = _request_kind(target_path)
+    streaming = isinstance(req_json, dict) and bool(req_json.get('stream'))
+    deadline = StreamDeadline(settings.timeouts_for(kind, streaming))
+    client_response = None
+    writer = None
     try:
-        async with session.request(request.method, url, headers=headers, data=body) as response:
+        trace.begin('upstream_headers')
+        async with await _open_upstream(session, request, url, headers, body, settings,
+                                        trace, capture, deadline, req_model, tag) as response:
+            trace.end('upstream_headers', status=response.status)
+            trace.begin('first_byte')
             client_response = web.StreamResponse(status=response.status, reason=response.reason)
             for k, v in response.headers.items():
                 if k.lower() not in ['transfer-encoding', 'content-length']:
                     client_response.headers[k] = v
 
             is_sse = 'text/event-stream' in response.headers.get('Content-Type', '')
+            if is_sse and not streaming:
+                deadline.set_limits(settings.timeouts_for(kind))
             request_id = f"chatcmpl-{uuid.uuid4()}"
             await client_response.prepare(request)
+            capture.response(response.status, is_sse)
+
+            async def send(data):
+                trace.begin('write')
+                await client_response.write(data)
+                trace.end('write', bytes=len(data))
+
+            # Collect the completion text so the FIM cache can replay it later
+            fim_parts = [] if fim_bucket is not None and response.status == 200 else None
+            fim_finish = None
 
             if is_sse:
+                writer = SseWriter(request, client_response, trace, settings.sse_coalesce_ms / 1000,
+                                   settings.sse_coalesce_backlog)
                 buffer = ""
                 last_progress = 0
+                done_seen = False
                 async for chunk in response.content:
+                    deadline.activity()
+                    trace.end('first_byte')  # only the first end() per span name is recorded
                     if chunk:
                         buffer += chunk.decode('utf-8', errors='replace')
                         while '\n' in buffer:
@@ -273,12 +1562,16 @@ async def handle_proxy(request):
                             try:
                                 if line.startswith('data: ') and line != 'data: [DONE]':
                                     data = json.loads(line[6:])
+                                    capture.event(data)
                                     if 'id' not in data: data['id'] = request_id
                                     # Strip unsupported fields
                                     for ch in data.get('choices', []):
                                         ch.get('delta', {}).pop('reasoning_content', None)
+                                        if fim_parts is not None and ch.get('index', 0) == 0:
+                                            fim_parts.append(ch.get('text') or '')
+                                            fim_finish = ch.get('finish_reason') or fim_finish
                                     # Each SSE event must end with a blank line for strict clients.
-                                    await client_response.write(f"data: {json.dumps(data)}\n\n".encode('utf-8'))
+                                    await writer.write(f"data: {json.dumps(data)}\n\n".encode('utf-8'))
                                     if is_completion:
                                         record_token()
                                         # Update progress every 10 tokens
@@ -288,14 +1581,33 @@ async def handle_proxy(request):
                                             sys.stdout.flush()
                                             last_progress = _token_count
                                 else:
-                                    await client_response.write((line + '\n').encode('utf-8'))
-                            except:
-                                await client_response.write((line + '\n').encode('utf-8'))
+                                    # [DONE] is dispatched by the blank line after it, so flush that at once
+                                    await writer.write((line + '\n').encode('utf-8'), urgent=done_seen and not line)
+                                    done_seen = done_seen or line == 'data: [DONE]'
+                            except Exception:
+                                await writer.write((line + '\n').encode('utf-8'))
                 if buffer.strip():
-                    await client_response.write(buffer.encode('utf-8'))
+                    await writer.write(buffer.encode('utf-8'))
+                await writer.close()
             else:
                 async for chunk in response.content:
-                    await client_response.write(chunk)
+                    deadline.activity()
+                    trace.end('first_byte')
+                    await send(chunk)
+                    capture.body(chunk)
+                    if fim_parts is not None:
+                        fim_parts.append(chunk)
+                        if sum(len(p) for p in fim_parts) > _FIM_MAX_BODY:
+                            fim_parts = None
+                if fim_parts is not None:
+                    try:
+                        choice = json.loads(b''.join(fim_parts))['choices'][0]
+                        fim_parts, fim_finish = [choice.get('text') or ''], choice.get('finish_reason')
+                    except (ValueError, KeyError, IndexError, TypeError):
+                        fim_parts = None
+
+            if fim_parts is not None:
+                _fim_cache.store(fim_bucket, fim_prompt, ''.join(fim_parts), fim_finish, settings)
 
             # Final logging
             elapsed = time.time() - req_start
@@ -311,21 +1623,53 @@ async def handle_proxy(request):
             else:
                 _log_non_completion(target_path, response.status, elapsed)
 
+            trace.begin('close')
+            await client_response.write_eof()
+            trace.end('close')
             return client_response
+    except asyncio.CancelledError:
+        if not deadline.expired:
+            raise  # the client went away
+        task = asyncio.current_task()
+        if hasattr(task, 'uncancel'):
+            task.uncancel()
+        _generating = False
+        return await _phase_timeout(kind, deadline.expired, deadline.limit(), client_response, writer)
     except asyncio.TimeoutError:
         _generating = False
-        sys.stdout.write(f"\r{' ' * 80}\r")
-        log(f"{C_YELLOW}⚠  Timeout{C_RESET} - server did not respond within 300s")
-        return web.Response(text="Proxy Error: Upstream request timed out (300s)", status=504)
+        return await _phase_timeout(kind, 'connect', settings.timeout_connect, client_response, writer)
+    except UpstreamNotReady as e:
+        _generating = False
+        return web.Response(text=f"Proxy Error: {e}", status=503)
     except aiohttp.ClientConnectorError:
         _generating = False
-        log(f"{C_RED}✗  Connection failed{C_RESET} - cannot reach {TARGET_URL}")
+        log(f"{C_RED}✗  Connection failed{C_RESET} - cannot reach {settings.target_url}")
         log(f"   {C_DIM}Is OVMS running? Try: .\\start_server.ps1{C_RESET}")
-        return web.Response(text=f"Proxy Error: Cannot connect to {TARGET_URL}", status=502)
+        return web.Response(text=f"Proxy Error: Cannot connect to {settings.target_url}", status=502)
     except Exception as e:
         _generating = False
         log(f"{C_RED}✗  Error:{C_RESET} {e}")
         return web.Response(text=f"Proxy Error: {str(e)}", status=500)
+    finally:
+        deadline.cancel()
+
+async def _phase_timeout(kind, phase, limit, client_response, writer):
+    """Report an upstream timeout to the client in whatever state the response is in."""
+    _timeout_counts[(kind, phase)] += 1
+    sys.stdout.write(f"\r{' ' * 80}\r")
+    log(f"{C_YELLOW}⚠  Timeout{C_RESET} - {kind} request hit the {phase} limit ({limit:g}s), upstream cancelled")
+    error = _timeout_error(kind, phase, limit)
+    if client_response is None or not client_response.prepared:
+        return web.json_response(error, status=504)
+    if writer is not None:
+        # Mid-stream: end the SSE stream with an error event clients can show.
+        try:
+            await writer.close()
+            await writer.write(f"data: {json.dumps(error)}\n\ndata: [DONE]\n\n".encode('utf-8'), urgent=True)
+            await client_response.write_eof()
+        except Exception:
+            pass
+    return client_response
 
 def _log_non_completion(path, status, elapsed):
     global _last_model_check
@@ -343,9 +1687,483 @@ def log(msg):
     ts = time.strftime("%H:%M:%S")
     print(f"  {C_DIM}{ts}{C_RESET}  {msg}", flush=True)
 
+# ── Metrics Endpoint ───────────────────────────────────────
+async def handle_metrics(request):
+    """JSON snapshot of proxy counters (served by the proxy, not OVMS)."""
+    return web.json_response({
+        "uptime_sec": int(time.time() - _boot_time),
+        "requests": _request_count,
+        "completions": _completion_id,
+        "total_tokens": _total_tokens,
+        "last_tps": round(_last_tps, 2),
+        "fim_cache": _fim_cache.stats(),
+        "sse_writes": _sse_stats.stats(),
+        "timeouts": _timeout_stats(),
+        "waiting_room": _waiting_room.stats(),
+        "batches": _batch_runner.stats(),
+        "embedding_batching": _embed_batcher.stats(),
+        "upstream_pool": _upstream_pool.stats(),
+    })
+
+# ── Admin: Sampling Profiler ───────────────────────────────
+_PROFILE_MAX_SEC = 120
+_profile_lock = asyncio.Lock()
+
+def _admin_check(request, settings):
+    """Return an error response unless the request carries the admin token."""
+    if not settings.admin_token:
+        return web.Response(text="Admin endpoints are disabled: set PROXY_ADMIN_TOKEN in config.env", status=403)
+    given = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(given.encode('utf-8'), f"Bearer {settings.admin_token}".encode('utf-8')):
+        return web.Response(text="Unauthorized", status=401)
+    return None
+
+def sample_stacks(thread_id, seconds, interval):
+    """Sample a thread's Python stack for `seconds`; returns folded stack counts."""
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if parts:
+            stacks[';'.join(reversed(parts))] += 1
+        time.sleep(interval)
+    return stacks
+
+async def handle_profile(request):
+    """Profile the live event loop for N seconds.
+
+    Returns folded stacks ("frame;frame;frame count" per line), the input
+    format of flamegraph.pl and speedscope.
+    """
+    denied = _admin_check(request, _settings)
+    if denied:
+        return denied
+    try:
+        seconds = float(request.query.get('seconds', '10'))
+        interval = float(request.query.get('interval_ms', '5')) / 1000
+    except ValueError:
+        return web.Response(text="seconds and interval_ms must be numbers", status=400)
+    if not 0 < seconds <= _PROFILE_MAX_SEC or not 0.001 <= interval <= 1:
+        return web.Response(text=f"seconds must be in (0, {_PROFILE_MAX_SEC}], interval_ms in [1, 1000]", status=400)
+    if _profile_lock.locked():
+        return web.Response(text="A profile is already running", status=409)
+
+    async with _profile_lock:
+        log(f"{C_CYAN}⏱  Profiling{C_RESET} event loop for {seconds:.0f}s")
+        stacks = await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds, interval)
+    folded = ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    return web.Response(text=folded, headers={"X-Profile-Samples": str(sum(stacks.values()))})
+
+# ── Batch Jobs ─────────────────────────────────────────────
+# OpenAI-batch-style offline jobs. Each job lives in <PROXY_BATCH_DIR>/<id>/ as
+# input.jsonl (as submitted), output.jsonl (one line per finished request) and
+# job.json (status). Jobs run one at a time at PROXY_BATCH_CONCURRENCY and, with
+# PROXY_BATCH_YIELD on, only dispatch while no interactive inference is running.
+# After a restart, unfinished jobs resume and skip custom_ids already in the output.
+_BATCH_ENDPOINTS = ('/v3/chat/completions', '/v3/completions', '/v3/embeddings')
+# OpenAI batch files use /v1 URLs; OVMS only serves the OpenAI API under /v3.
+_BATCH_URL_ALIASES = {url.replace('/v3/', '/v1/', 1): url for url in _BATCH_ENDPOINTS}
+_BATCH_ACTIVE = ('queued', 'in_progress', 'cancelling')
+_BATCH_IDLE_POLL = 0.25
+_BATCH_SAVE_EVERY = 2.0  # seconds between job.json progress writes
+_BATCH_DISCONNECT_RETRIES = 3
+
+_interactive_inflight = 0
+
+def _is_inference(path):
+    return "completions" in path or "embeddings" in path
+
+def _validate_batch_input(path):
+    """Check every line of a batch input file; returns the request count."""
+    seen = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                raise ValueError(f"line {n}: not valid JSON")
+            if not isinstance(item, dict):
+                raise ValueError(f"line {n}: expected a JSON object")
+            custom_id = item.get('custom_id')
+            if not isinstance(custom_id, str) or not custom_id:
+                raise ValueError(f"line {n}: custom_id is required")
+            if custom_id in seen:
+                raise ValueError(f"line {n}: duplicate custom_id {custom_id!r}")
+            seen.add(custom_id)
+            method = item.get('method', 'POST')
+            if not isinstance(method, str) or method.upper() != 'POST':
+                raise ValueError(f"line {n}: only POST requests are supported")
+            url = item.get('url')
+            if not isinstance(url, str) or _BATCH_URL_ALIASES.get(url, url) not in _BATCH_ENDPOINTS:
+                raise ValueError(f"line {n}: url must be one of {', '.join(_BATCH_ENDPOINTS)}")
+            if not isinstance(item.get('body'), dict):
+                raise ValueError(f"line {n}: body must be a JSON object")
+    if not seen:
+        raise ValueError("batch input is empty")
+    return len(seen)
+
+class BatchJob:
+    """One batch job and its files on disk."""
+
+    def __init__(self, job_dir, meta):
+        self.dir = job_dir
+        self.meta = meta
+        self.run_started = None
+        self.run_done = 0
+        self.run_tokens = 0
+
+    @property
+    def id(self):
+        return self.meta["id"]
+
+    @property
+    def input_path(self):
+        return os.path.join(self.dir, 'input.jsonl')
+
+    @property
+    def output_path(self):
+        return os.path.join(self.dir, 'output.jsonl')
+
+    @classmethod
+    def load(cls, job_dir):
+        with open(os.path.join(job_dir, 'job.json'), 'r', encoding='utf-8') as f:
+            return cls(job_dir, json.load(f))
+
+    def save(self):
+        path = os.path.join(self.dir, 'job.json')
+        temp = path + ".tmp"
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(temp, path)
+
+    def iter_input(self):
+        with open(self.input_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def scan_output(self):
+        """Return custom_ids already answered and recount progress from output.jsonl."""
+        done = set()
+        counts = {"total": self.meta["request_counts"]["total"], "completed": 0, "failed": 0}
+        if os.path.exists(self.output_path):
+            # A crash can leave half a line at the end; drop it so appends stay valid JSONL.
+            with open(self.output_path, 'rb+') as f:
+                data = f.read()
+                f.truncate(data.rfind(b'\n') + 1)
+            for line in data[:data.rfind(b'\n') + 1].splitlines():
+                record = json.loads(line)
+                done.add(record["custom_id"])
+                status = (record.get("response") or {}).get("status_code", 0)
+                counts["completed" if 200 <= status < 300 else "failed"] += 1
+        self.meta["request_counts"] = counts
+        return done
+
+    def to_dict(self):
+        info = dict(self.meta)
+        if self.run_started is not None and self.meta["status"] == "in_progress":
+            elapsed = max(time.monotonic() - self.run_started, 1e-6)
+            counts = self.meta["request_counts"]
+            remaining = counts["total"] - counts["completed"] - counts["failed"]
+            rps = self.run_done / elapsed
+            info["throughput"] = {
+                "requests_per_sec": round(rps, 3),
+                "tokens_per_sec": round(self.run_tokens / elapsed, 1),
+                "eta_sec": round(remaining / rps) if rps > 0 else None,
+            }
+        return info
+
+async def _wait_for_idle_gpu():
+    while _settings.batch_yield and _interactive_inflight > 0:
+        await asyncio.sleep(_BATCH_IDLE_POLL)
+
+async def _run_batch_item(job, item):
+    """Execute one batch line against OVMS.
+
+    Returns (output record, ok, tokens), or None if the job was cancelled
+    while the line waited for OVMS to come back.
+    """
+    settings = _settings
+    path = _BATCH_URL_ALIASES.get(item['url'], item['url'])
+    url = f"{settings.target_url}{path}"
+    body = dict(item['body'])
+    body.pop('stream', None)
+    body.pop('stream_options', None)
+    limits = settings.timeouts_for(_request_kind(path))
+    timeout = aiohttp.ClientTimeout(total=limits.total or None, connect=settings.timeout_connect or None)
+    record = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": item["custom_id"], "response": None, "error": None}
+    session = await get_session()
+    attempt = disconnects = 0
+    unavailable_since = None
+    while True:
+        if job.meta["status"] == "cancelling":
+            return None
+        try:
+            async with session.post(url, json=body, timeout=timeout) as resp:
+                if not _upstream_not_ready(resp, body.get('model'), settings):
+                    raw = await resp.read()
+                    try:
+                        payload = json.loads(raw)
+                    except ValueError:
+                        payload = raw.decode('utf-8', errors='replace')
+                    record["response"] = {"status_code": resp.status, "body": payload}
+                    usage = payload.get("usage") if isinstance(payload, dict) else None
+                    tokens = (usage or {}).get("completion_tokens") or (usage or {}).get("total_tokens") or 0
+                    return record, 200 <= resp.status < 300, tokens
+        except aiohttp.ClientConnectorError:
+            pass
+        except aiohttp.ServerDisconnectedError as e:
+            disconnects += 1
+            if disconnects > _BATCH_DISCONNECT_RETRIES:
+                record["error"] = {"code": type(e).__name__, "message": str(e)}
+                return record, False, 0
+            await asyncio.sleep(_HOLD_BACKOFF_MAX * random.uniform(0.5, 1.0))
+            continue
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            record["error"] = {"code": type(e).__name__, "message": str(e) or "request timed out"}
+            return record, False, 0
+        # OVMS is restarting or swapping models (unreachable, 503, or 404 for
+        # MODEL_NAME): wait and retry the same line, up to PROXY_BATCH_HOLD_SEC.
+        now = time.monotonic()
+        unavailable_since = unavailable_since or now
+        if settings.batch_hold_sec and now - unavailable_since >= settings.batch_hold_sec:
+            record["error"] = {"code": "upstream_unavailable",
+                               "message": f"OVMS not ready after waiting {settings.batch_hold_sec:g}s"}
+            return record, False, 0
+        await asyncio.sleep(min(_HOLD_BACKOFF_MAX, _HOLD_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0))
+        attempt += 1
+
+class BatchRunner:
+    def __init__(self):
+        self.jobs = OrderedDict()
+        self.active = None
+        self.inflight = 0
+        self._wake = asyncio.Event()
+
+    def load(self, root):
+        if not os.path.isdir(root):
+            return
+        jobs = []
+        for name in os.listdir(root):
+            if not os.path.exists(os.path.join(root, name, 'job.json')):
+                continue
+            try:
+                jobs.append(BatchJob.load(os.path.join(root, name)))
+            except (OSError, ValueError) as e:
+                log(f"{C_YELLOW}⚠  Skipping batch {name}:{C_RESET} {e}")
+        for job in sorted(jobs, key=lambda j: j.meta["created_at"]):
+            self.jobs[job.id] = job
+        pending = sum(1 for j in jobs if j.meta["status"] in _BATCH_ACTIVE)
+        if pending:
+            log(f"{C_CYAN}↻  Resuming {pending} batch job(s){C_RESET}")
+
+    def submit(self, job):
+        self.jobs[job.id] = job
+        self._wake.set()
+
+    def cancel(self, job):
+        if job.meta["status"] not in _BATCH_ACTIVE:
+            return
+        if job is self.active:
+            job.meta["status"] = "cancelling"
+        else:
+            job.meta.update(status="cancelled", cancelled_at=int(time.time()))
+        job.save()
+
+    async def run(self):
+        while True:
+            job = next((j for j in self.jobs.values() if j.meta["status"] in _BATCH_ACTIVE), None)
+            if job is None:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            try:
+                await self._run_job(job)
+            except (OSError, ValueError, KeyError) as e:
+                job.meta.update(status="failed", failed_at=int(time.time()), errors=[str(e)])
+                job.save()
+                log(f"{C_RED}✗  Batch {job.id} failed:{C_RESET} {e}")
+
+    async def _run_job(self, job):
+        if job.meta["status"] == "cancelling":
+            job.meta.update(status="cancelled", cancelled_at=int(time.time()))
+            job.save()
+            return
+        concurrency = _settings.batch_concurrency
+        # Output files can be hundreds of MB; keep the event loop free for live streams.
+        done = await asyncio.to_thread(job.scan_output)
+        job.meta["status"] = "in_progress"
+        job.meta.setdefault("in_progress_at", int(time.time()))
+        job.save()
+        job.run_started, job.run_done, job.run_tokens = time.monotonic(), 0, 0
+        self.active = job
+        log(f"{C_CYAN}▶  Batch {job.id}{C_RESET} - {len(done)}/{job.meta['request_counts']['total']} done, concurrency {concurrency}")
+        queue = asyncio.Queue(maxsize=concurrency)
+        try:
+            with open(job.output_path, 'a', encoding='utf-8') as out:
+                workers = [asyncio.ensure_future(self._worker(job, queue, out)) for _ in range(concurrency)]
+                try:
+                    for item in job.iter_input():
+                        if job.meta["status"] == "cancelling":
+                            break
+                        if item["custom_id"] not in done:
+                            await queue.put(item)
+                    for _ in workers:
+                        await queue.put(None)
+                    await asyncio.gather(*workers)
+                finally:
+                    for w in workers:
+                        w.cancel()
+        finally:
+            self.active = None
+        if job.meta["status"] == "cancelling":
+            job.meta.update(status="cancelled", cancelled_at=int(time.time()))
+        else:
+            job.meta.update(status="completed", completed_at=int(time.time()))
+        job.save()
+        counts = job.meta["request_counts"]
+        log(f"{C_GREEN}✓  Batch {job.id}{C_RESET} {job.meta['status']} - {counts['completed']} ok, {counts['failed']} failed")
+
+    async def _worker(self, job, queue, out):
+        last_save = time.monotonic()
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if job.meta["status"] == "cancelling":
+                continue
+            await _wait_for_idle_gpu()
+            self.inflight += 1
+            try:
+                result = await _run_batch_item(job, item)
+            finally:
+                self.inflight -= 1
+            if result is None:
+                continue  # cancelled: the line stays unanswered
+            record, ok, tokens = result
+            out.write(json.dumps(record, ensure_ascii=True) + "\n")
+            out.flush()
+            job.meta["request_counts"]["completed" if ok else "failed"] += 1
+            job.run_done += 1
+            job.run_tokens += tokens
+            if time.monotonic() - last_save >= _BATCH_SAVE_EVERY:
+                job.save()
+                last_save = time.monotonic()
+
+    def stats(self):
+        return {
+            "active": self.active.id if self.active else None,
+            "pending": sum(1 for j in self.jobs.values() if j.meta["status"] in _BATCH_ACTIVE),
+            "inflight": self.inflight,
+            "interactive_inflight": _interactive_inflight,
+        }
+
+_batch_runner = BatchRunner()
+
+def _batch_error(message, status, kind="invalid_request_error"):
+    return web.json_response({"error": {"message": message, "type": kind}}, status=status)
+
+def _get_batch(request):
+    return _batch_runner.jobs.get(request.match_info['batch_id'])
+
+async def handle_batch_create(request):
+    """Accept a JSONL body of {custom_id, method, url, body} lines and queue it."""
+    settings = _settings
+    # The endpoint is open to the LAN, so cap what one upload can put on disk.
+    max_bytes = int(settings.batch_max_mb * 1024 * 1024) or None
+    too_large = _batch_error(f"Batch input exceeds PROXY_BATCH_MAX_MB ({settings.batch_max_mb:g} MB)", 413)
+    if max_bytes and (request.content_length or 0) > max_bytes:
+        return too_large
+    job_id = f"batch_{uuid.uuid4().hex[:24]}"
+    job_dir = os.path.join(settings.batch_dir, job_id)
+    # Streamed to disk: batch files are far larger than aiohttp's client_max_size.
+    try:
+        os.makedirs(job_dir)
+        size = 0
+        with open(os.path.join(job_dir, 'input.jsonl'), 'wb') as f:
+            async for chunk in request.content.iter_chunked(1 << 16):
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    break
+                f.write(chunk)
+        if max_bytes and size > max_bytes:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            return too_large
+        total = await asyncio.to_thread(_validate_batch_input, os.path.join(job_dir, 'input.jsonl'))
+        job = BatchJob(job_dir, {
+            "id": job_id,
+            "object": "batch",
+            "status": "queued",
+            "created_at": int(time.time()),
+            "request_counts": {"total": total, "completed": 0, "failed": 0},
+            "output_url": f"/proxy/batches/{job_id}/output",
+        })
+        job.save()
+    except (ValueError, UnicodeDecodeError) as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return _batch_error(f"Invalid batch input: {e}", 400)
+    except OSError as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        log(f"{C_RED}✗  Batch {job_id}{C_RESET} could not be stored: {e}")
+        return _batch_error(f"Could not store batch input: {e.strerror or e}", 500, "server_error")
+    except BaseException:
+        # Never leave an input.jsonl without job.json behind: load() would not clean it up.
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+    _batch_runner.submit(job)
+    log(f"{C_CYAN}📦  Batch {job_id}{C_RESET} queued - {total} requests")
+    return web.json_response(job.to_dict())
+
+async def handle_batch_list(request):
+    return web.json_response({"object": "list", "data": [j.to_dict() for j in reversed(_batch_runner.jobs.values())]})
+
+async def handle_batch_get(request):
+    job = _get_batch(request)
+    if job is None:
+        return _batch_error("No such batch", 404)
+    return web.json_response(job.to_dict())
+
+async def handle_batch_output(request):
+    job = _get_batch(request)
+    if job is None:
+        return _batch_error("No such batch", 404)
+    if not os.path.exists(job.output_path):
+        return web.Response(text="", content_type="application/x-ndjson")
+    return web.FileResponse(job.output_path, headers={"Content-Type": "application/x-ndjson"})
+
+async def handle_batch_cancel(request):
+    job = _get_batch(request)
+    if job is None:
+        return _batch_error("No such batch", 404)
+    _batch_runner.cancel(job)
+    return web.json_response(job.to_dict())
+
+async def start_batch_runner(app):
+    _batch_runner.load(_settings.batch_dir)
+    app['batch_task'] = asyncio.create_task(_batch_runner.run())
+
+async def stop_batch_runner(app):
+    app['batch_task'].cancel()
+    try: await app['batch_task']
+    except asyncio.CancelledError: pass
+
 # ── App Setup ──────────────────────────────────────────────
 app = web.Application()
 app.on_cleanup.append(cleanup_session)
+app.router.add_get('/proxy/metrics', handle_metrics)
+app.router.add_post('/proxy/admin/profile', handle_profile)
+app.router.add_post('/proxy/batches', handle_batch_create)
+app.router.add_get('/proxy/batches', handle_batch_list)
+app.router.add_get('/proxy/batches/{batch_id}', handle_batch_get)
+app.router.add_get('/proxy/batches/{batch_id}/output', handle_batch_output)
+app.router.add_post('/proxy/batches/{batch_id}/cancel', handle_batch_cancel)
 app.router.add_route('*', '/{path_info:.*}', handle_proxy)
 
 async def start_telemetry(app):
@@ -356,12 +2174,30 @@ async def stop_telemetry(app):
     try: await app['telemetry_task']
     except asyncio.CancelledError: pass
 
+async def start_config_watch(app):
+    app['config_watch_task'] = asyncio.create_task(config_watch_loop())
+
+async def stop_config_watch(app):
+    app['config_watch_task'].cancel()
+    try: await app['config_watch_task']
+    except asyncio.CancelledError: pass
+
+async def warm_upstream_pool(app):
+    if _settings.pool_warmup > 0 and _settings.pool_keepalive_sec > 0:
+        # In the background, so a slow or absent OVMS does not delay startup.
+        app['pool_warmup_task'] = asyncio.create_task(_upstream_pool.warm(_settings))
+
+app.on_startup.append(warm_upstream_pool)
 app.on_startup.append(start_telemetry)
 app.on_cleanup.append(stop_telemetry)
+app.on_startup.append(start_config_watch)
+app.on_cleanup.append(stop_config_watch)
+app.on_startup.append(start_batch_runner)
+app.on_shutdown.append(stop_batch_runner)  # before cleanup closes the upstream session
 
 if __name__ == '__main__':
     # Set up fixed top bar (3 lines) + scrolling log region below
-    title = f" Proxy :{PORT} -> {TARGET_URL}"
+    title = f" Proxy :{PORT} -> {_settings.target_url}"
     if _has_xpu:
         title += "  │  xpu-smi: ✓"
     else:
@@ -0,0 +1 @@
+"""Capture/replay tooling for realistic proxy load tests."""
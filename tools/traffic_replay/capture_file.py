@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class CapturedRequest:
+    index: int
+    t: float
+    method: str
+    path: str
+    ua: str = ""
+    client: Optional[str] = None
+    body: Any = None
+    status: int = 200
+    sse: bool = False
+    ttfb_ms: float = 0.0
+    duration_ms: float = 0.0
+    upstream_ms: float = 0.0
+    events: Optional[List[list]] = None
+    response: Any = None
+    cache_hit: bool = False
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def model(self) -> Optional[str]:
+        if isinstance(self.body, dict):
+            return self.body.get("model")
+        return None
+
+    @property
+    def wants_stream(self) -> bool:
+        return isinstance(self.body, dict) and bool(self.body.get("stream"))
+
+
+_KNOWN = {"t", "method", "path", "ua", "client", "body", "status", "sse", "ttfb_ms", "duration_ms", "upstream_ms", "queued_ms", "events", "response", "cache_hit"}
+
+
+def load_capture(path: Path, limit: Optional[int] = None) -> List[CapturedRequest]:
+    records: List[CapturedRequest] = []
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            raw = json.loads(line)
+            records.append(
+                CapturedRequest(
+                    index=len(records),
+                    t=float(raw["t"]),
+                    method=raw.get("method", "GET"),
+                    path=raw.get("path", "/"),
+                    ua=raw.get("ua", ""),
+                    client=raw.get("client"),
+                    body=raw.get("body"),
+                    status=int(raw.get("status") or 502),
+                    sse=bool(raw.get("sse")),
+                    ttfb_ms=float(raw.get("ttfb_ms") or 0.0),
+                    duration_ms=float(raw.get("duration_ms") or 0.0),
+                    upstream_ms=float(raw.get("upstream_ms") or 0.0),
+                    events=raw.get("events"),
+                    response=raw.get("response"),
+                    cache_hit=bool(raw.get("cache_hit")),
+                    extra={k: v for k, v in raw.items() if k not in _KNOWN},
+                )
+            )
+            if limit is not None and len(records) >= limit:
+                break
+    records.sort(key=lambda r: r.t)
+    return records
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from .capture_file import CapturedRequest
+
+REPLAY_HEADER = "X-Replay-Id"
+
+
+class MockOvms:
+    """Answers replayed requests with the recorded status, payload and token timing."""
+
+    def __init__(self, records: List[CapturedRequest], speed: float = 1.0):
+        self.speed = speed
+        self.by_index: Dict[int, CapturedRequest] = {r.index: r for r in records}
+        self.by_route: Dict[Tuple[str, str], CapturedRequest] = {}
+        for r in records:
+            if r.status < 500:
+                self.by_route[(r.method, r.path.split("?", 1)[0])] = r
+        self.models = sorted({r.model for r in records if r.model})
+        self.served = 0
+        self.unmatched = 0
+
+    def match(self, request: web.Request) -> Optional[CapturedRequest]:
+        replay_id = request.headers.get(REPLAY_HEADER)
+        if replay_id is not None and replay_id.isdigit() and int(replay_id) in self.by_index:
+            return self.by_index[int(replay_id)]
+        return self.by_route.get((request.method, request.path))
+
+    async def _sleep_until(self, start: float, offset_ms: float) -> None:
+        delay = start + offset_ms / 1000 / self.speed - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        start = time.perf_counter()
+        await request.read()
+        record = self.match(request)
+        if record is None:
+            self.unmatched += 1
+            if request.path.endswith("/models"):
+                return web.json_response({"object": "list", "data": [{"id": m, "object": "model"} for m in self.models]})
+            return web.json_response({"error": f"No captured request for {request.method} {request.path}"}, status=404)
+
+        self.served += 1
+        if record.events is not None and (record.sse or record.wants_stream):
+            return await self._stream(request, record, start)
+
+        # Captures from before upstream_ms was recorded only have the proxy-side duration.
+        await self._sleep_until(start, record.upstream_ms or record.duration_ms)
+        if record.response is not None:
+            return web.json_response(record.response, status=record.status)
+        if record.events is not None:
+            return web.json_response(_completion_body(record), status=record.status)
+        return web.json_response({}, status=record.status)
+
+    async def _stream(self, request: web.Request, record: CapturedRequest, start: float) -> web.StreamResponse:
+        await self._sleep_until(start, record.ttfb_ms)
+        response = web.StreamResponse(status=record.status, headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chat = "chat/completions" in record.path
+        for event in record.events or []:
+            await self._sleep_until(start, event[0])
+            finish = event[2] if len(event) > 2 else None
+            await response.write(f"data: {json.dumps(_chunk(record, event[1], finish, chat))}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"served": self.served, "unmatched": self.unmatched})
+
+
+def _chunk(record: CapturedRequest, text: str, finish: Optional[str], chat: bool) -> dict:
+    if chat:
+        choice = {"index": 0, "delta": {"content": text}, "finish_reason": finish}
+        return {"object": "chat.completion.chunk", "created": int(time.time()), "model": record.model, "choices": [choice]}
+    return {"object": "text_completion", "model": record.model, "choices": [{"index": 0, "text": text, "finish_reason": finish}]}
+
+
+def _completion_body(record: CapturedRequest) -> dict:
+    events = record.events or []
+    text = "".join(e[1] for e in events)
+    finish = next((e[2] for e in reversed(events) if len(e) > 2), "stop")
+    return {
+        "id": f"cmpl-{uuid.uuid4()}",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": record.model,
+        "choices": [{"index": 0, "text": text, "finish_reason": finish}],
+    }
+
+
+def build_app(records: List[CapturedRequest], speed: float = 1.0) -> web.Application:
+    mock = MockOvms(records, speed=speed)
+    app = web.Application()
+    app.router.add_get("/replay/stats", mock.handle_stats)
+    app.router.add_route("*", "/{path_info:.*}", mock.handle)
+    return app
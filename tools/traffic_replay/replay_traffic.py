@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+if __package__ is None or __package__ == "":
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from aiohttp import web
+
+from tools.traffic_replay.capture_file import load_capture
+from tools.traffic_replay.mock_ovms import build_app
+from tools.traffic_replay.replayer import replay, summarize
+
+
+def _print_json(payload: object) -> None:
+    print(json.dumps(payload, indent=2, ensure_ascii=True))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Replay captured proxy traffic with its original timing.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    mock = sub.add_parser("mock", help="Serve a mock OVMS that reproduces the captured responses and token timing.")
+    mock.add_argument("capture", help="Capture file written by proxy_server.py (PROXY_CAPTURE=1).")
+    mock.add_argument("--port", type=int, default=8000, help="Port to listen on (point OVMS_PORT here).")
+    mock.add_argument("--speed", type=float, default=1.0, help="Time scale for token timing (2 = twice as fast).")
+
+    run = sub.add_parser("run", help="Re-issue the captured requests against the proxy.")
+    run.add_argument("capture", help="Capture file written by proxy_server.py (PROXY_CAPTURE=1).")
+    run.add_argument("--target", default="http://localhost:8001", help="Proxy base URL.")
+    run.add_argument("--speed", type=float, default=1.0, help="Time scale for inter-arrival times (2 = twice as fast).")
+    run.add_argument("--limit", type=int, help="Only replay the first N captured requests.")
+    run.add_argument("--out", help="Optional JSONL file for per-request results.")
+    return p
+
+
+def main() -> int:
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed must be > 0")
+
+    try:
+        records = load_capture(Path(args.capture), limit=getattr(args, "limit", None))
+    except (OSError, ValueError, KeyError) as exc:
+        _print_json({"error": f"Cannot read capture: {exc}"})
+        return 1
+
+    if args.cmd == "mock":
+        print(f"Mock OVMS on :{args.port} serving {len(records)} captured requests (speed x{args.speed})", flush=True)
+        web.run_app(build_app(records, speed=args.speed), port=args.port, access_log=None, print=lambda *a: None)
+        return 0
+
+    if args.cmd == "run":
+        start = time.perf_counter()
+        results = asyncio.run(replay(records, args.target, speed=args.speed))
+        summary = summarize(results, time.perf_counter() - start)
+        if args.out:
+            with Path(args.out).open("w", encoding="utf-8") as f:
+                for r in results:
+                    f.write(json.dumps(r.to_dict(), ensure_ascii=True) + "\n")
+        _print_json(summary)
+        return 0 if summary["errors"] == 0 else 1
+
+    parser.error("Unknown command")
+    return 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from .capture_file import CapturedRequest
+from .mock_ovms import REPLAY_HEADER
+
+
+@dataclass
+class ReplayResult:
+    index: int
+    path: str
+    client: Optional[str]
+    scheduled_ms: float
+    lag_ms: float
+    status: int
+    ttfb_ms: float
+    total_ms: float
+    bytes: int
+    cache_hit: bool
+    recorded_ms: float
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, object]:
+        return asdict(self)
+
+
+async def _send(
+    session: aiohttp.ClientSession,
+    target: str,
+    record: CapturedRequest,
+    origin: float,
+    offset_sec: float,
+) -> ReplayResult:
+    delay = origin + offset_sec - time.perf_counter()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    start = time.perf_counter()
+    headers = {REPLAY_HEADER: str(record.index)}
+    if record.ua:
+        headers["User-Agent"] = record.ua
+    data = None
+    if record.body is not None:
+        data = json.dumps(record.body).encode("utf-8")
+        headers["Content-Type"] = "application/json"
+
+    status, size, ttfb, cache_hit, error = 0, 0, 0.0, False, None
+    try:
+        async with session.request(record.method, target + record.path, data=data, headers=headers) as resp:
+            status = resp.status
+            cache_hit = resp.headers.get("X-Proxy-Cache") == "hit"
+            async for chunk in resp.content.iter_any():
+                if not size:
+                    ttfb = time.perf_counter() - start
+                size += len(chunk)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+        error = f"{type(exc).__name__}: {exc}"
+    end = time.perf_counter()
+    return ReplayResult(
+        index=record.index,
+        path=record.path,
+        client=record.client,
+        scheduled_ms=round(offset_sec * 1000, 1),
+        lag_ms=round((start - origin - offset_sec) * 1000, 1),
+        status=status,
+        ttfb_ms=round(ttfb * 1000, 1),
+        total_ms=round((end - start) * 1000, 1),
+        bytes=size,
+        cache_hit=cache_hit,
+        recorded_ms=record.duration_ms,
+        error=error,
+    )
+
+
+async def replay(
+    records: List[CapturedRequest],
+    target: str,
+    speed: float = 1.0,
+    timeout_sec: float = 600,
+) -> List[ReplayResult]:
+    if not records:
+        return []
+    t0 = records[0].t
+    timeout = aiohttp.ClientTimeout(total=timeout_sec)
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        origin = time.perf_counter()
+        tasks = [
+            _send(session, target.rstrip("/"), r, origin, (r.t - t0) / speed)
+            for r in records
+        ]
+        return list(await asyncio.gather(*tasks))
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def summarize(results: List[ReplayResult], wall_sec: float) -> Dict[str, object]:
+    groups: Dict[str, List[ReplayResult]] = {}
+    for r in results:
+        groups.setdefault(r.path.split("?", 1)[0], []).append(r)
+
+    by_path: Dict[str, object] = {}
+    for path, items in sorted(groups.items()):
+        ok = [r for r in items if r.error is None and r.status < 400]
+        by_path[path] = {
+            "count": len(items),
+            "errors": len(items) - len(ok),
+            "cache_hits": sum(1 for r in items if r.cache_hit),
+            "ttfb_p50_ms": _percentile([r.ttfb_ms for r in ok], 50),
+            "ttfb_p95_ms": _percentile([r.ttfb_ms for r in ok], 95),
+            "total_p50_ms": _percentile([r.total_ms for r in ok], 50),
+            "total_p95_ms": _percentile([r.total_ms for r in ok], 95),
+            "recorded_p50_ms": _percentile([r.recorded_ms for r in items], 50),
+        }
+    return {
+        "requests": len(results),
+        "errors": sum(1 for r in results if r.error is not None or r.status >= 400),
+        "wall_sec": round(wall_sec, 2),
+        "max_lag_ms": max((r.lag_ms for r in results), default=0.0),
+        "by_path": by_path,
+    }